@@ -121,6 +121,435 @@ df.dropna(axis=0, how='all', inplace=True)
 df.dtypes
 #la colonne des masses est de type object et non de type float
 
+# %% [markdown]
+# **pour aller plus loin**
+#
+# on a lu le fichier, puis supprimé des colonnes, puis des lignes, et ce n'est qu'après qu'on s'occupe des types
+# sur un gros inventaire, ça veut dire plusieurs dataframes complètes en mémoire, avec des colonnes `object`
+#
+# on peut à la place **décrire** le fichier avec un schéma (le type de chaque colonne, et les colonnes à ignorer)
+# et tout faire pendant la lecture, par morceaux:
+# - la première colonne sert d'index (c'est le numéro de ligne d'origine)
+# - `read_csv` fabrique directement les bons types: `category` pour `Country` et `Status`, entiers pour `Year`
+# - on enlève les lignes vides de chaque morceau, et on compte les valeurs présentes par colonne pour repérer les colonnes vides (comme `Size`)
+
+# %%
+MOON_SCHEMA = {
+    'Artificial object': str,
+    'Country': 'category',
+    'Year': 'Int16',
+    'Mass (lb)': str,
+    'Status': 'category',
+    'Location': str,
+}
+
+
+def read_with_schema(filename, schema, skip=(), chunksize=10_000, max_ratio=None):
+    """
+    lit un csv par morceaux avec les types de schema (les autres colonnes
+    sont lues avec les types par défaut), sans les colonnes de skip
+
+    les lignes et les colonnes entièrement vides sont supprimées
+    les colonnes entières (Int16...) sans valeur manquante sont converties
+    vers le type numpy correspondant (int16...)
+    si max_ratio est fourni, les colonnes de chaines avec peu de valeurs
+    distinctes sont converties en category (voir encode_low_cardinality plus bas)
+    """
+    header = pd.read_csv(filename, nrows=0).columns
+    usecols = [column for column in header if column not in skip]
+    reader = pd.read_csv(filename, index_col=0, usecols=usecols,
+                         dtype=schema, chunksize=chunksize)
+    # on garde les morceaux colonne par colonne, et on ne fabrique chaque colonne
+    # complète qu'une fois, sans jamais passer par une dataframe complète intermédiaire
+    pieces, indexes, present = {}, [], {}
+    for chunk in reader:
+        chunk = chunk.dropna(how='all')
+        indexes.append(chunk.index)
+        for column in chunk.columns:
+            pieces.setdefault(column, []).append(chunk[column])
+            present[column] = present.get(column, 0) + chunk[column].count()
+    columns = {}
+    for column, parts in pieces.items():
+        if not present[column]:
+            continue
+        if isinstance(parts[0].dtype, pd.CategoricalDtype):
+            # les catégories varient d'un morceau à l'autre: union_categoricals les unifie
+            values = pd.api.types.union_categoricals(parts)
+        elif isinstance(parts[0].dtype, pd.api.extensions.ExtensionDtype):
+            values = pd.concat(parts, ignore_index=True).array
+        else:
+            values = np.concatenate([part.to_numpy() for part in parts])
+        if isinstance(values.dtype, pd.api.extensions.ExtensionDtype) \
+                and values.dtype.kind in 'iu' and not values.isna().any():
+            values = values.to_numpy(dtype=values.dtype.numpy_dtype)
+        columns[column] = values
+        parts.clear()
+    index = indexes[0].append(indexes[1:]) if indexes else pd.RangeIndex(0)
+    df = pd.DataFrame(columns, index=index, copy=False)
+    df.index.name = None
+    if max_ratio is not None:
+        encode_low_cardinality(df, max_ratio)
+    return df
+
+
+# %%
+df_schema = read_with_schema('data/objects-on-the-moon.csv', MOON_SCHEMA)
+df_schema.dtypes
+
+# %% [markdown]
+# **pour aller plus loin**
+#
+# au-dessus on mélange `df = df.drop(...)` (une nouvelle dataframe) et `inplace=True` (qui, la plupart du temps,
+# fabrique aussi une copie en interne): difficile de savoir combien de copies de la table existent au pire moment
+#
+# on peut **décrire** le nettoyage (les étapes `drop`, `dropna`, `cast` et `derive`), puis l'exécuter en une fois:
+# - les `drop` et les `dropna` ne font que réduire la liste des colonnes et un masque des lignes à garder
+# - les `cast` sont faits colonne par colonne, au moment où on recopie les lignes gardées
+# - si bien que la table finale n'est fabriquée qu'une seule fois
+#
+# et on mesure au passage, avec `tracemalloc`, la mémoire allouée par chaque étape
+# (ce module ne voit que les allocations faites par Python et `numpy`, pas celles de `pyarrow`)
+
+# %%
+import tracemalloc
+
+
+class Pipeline:
+    """
+    une suite d'étapes de nettoyage, exécutées seulement par run(df)
+
+    les colonnes dérivées (derive) sont calculées à la fin, sur la table nettoyée
+    après run, self.report donne la mémoire allouée (bytes) et le pic (peak) par étape
+    """
+
+    def __init__(self):
+        self.steps = []
+        self.report = None
+
+    def drop(self, *columns):
+        self.steps.append(('drop', columns))
+        return self
+
+    def dropna(self, axis=0, how='all', subset=None):
+        """subset (les colonnes à regarder) ne sert que pour les lignes"""
+        self.steps.append(('dropna', (axis, how, subset)))
+        return self
+
+    def cast(self, dtypes):
+        """dtypes associe à une colonne un type, ou une fonction (par exemple pd.to_numeric)"""
+        self.steps.append(('cast', dtypes))
+        return self
+
+    def derive(self, column, function):
+        """function reçoit la table nettoyée et renvoie la nouvelle colonne"""
+        self.steps.append(('derive', (column, function)))
+        return self
+
+    def run(self, df):
+        columns, rows, casts, derived = list(df.columns), np.ones(len(df), dtype=bool), {}, []
+        report = []
+
+        def measure(step, action):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            result = action()
+            after, peak = tracemalloc.get_traced_memory()
+            report.append((step, after - before, peak - before))
+            return result
+
+        def missing(column):
+            return df[column].isna().to_numpy()
+
+        def drop_columns(axis, how, subset):
+            test = np.all if how == 'all' else np.any
+            return [column for column in columns if not test(missing(column)[rows])]
+
+        def drop_rows(axis, how, subset):
+            combine = np.logical_and if how == 'all' else np.logical_or
+            mask = np.full(len(df), how == 'all')
+            for column in (subset or columns):
+                combine(mask, missing(column), out=mask)
+            return rows & ~mask
+
+        def materialize():
+            keep = None if rows.all() else np.flatnonzero(rows)
+            data = {}
+            for column in columns:
+                values = df[column] if keep is None else df[column].take(keep)
+                dtype = casts.get(column)
+                if callable(dtype):
+                    values = dtype(values)
+                elif dtype is not None:
+                    values = values.astype(dtype)
+                data[column] = values
+            return pd.DataFrame(data, copy=False)
+
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        # si une étape échoue, on ne laisse pas le traçage actif (il ralentit toutes les allocations)
+        try:
+            for kind, args in self.steps:
+                if kind == 'drop':
+                    columns = [column for column in columns if column not in args]
+                elif kind == 'dropna' and args[0] in (1, 'columns'):
+                    columns = measure('dropna columns', lambda: drop_columns(*args))
+                elif kind == 'dropna':
+                    rows = measure('dropna rows', lambda: drop_rows(*args))
+                elif kind == 'cast':
+                    casts.update(args)
+                else:
+                    derived.append(args)
+
+            result = measure('materialize', materialize)
+            for column, function in derived:
+                result[column] = measure(f'derive {column}', lambda: function(result))
+        finally:
+            if started:
+                tracemalloc.stop()
+        self.report = pd.DataFrame(report, columns=['step', 'bytes', 'peak']).set_index('step')
+        return result
+
+
+# %%
+pipeline = (Pipeline()
+            .drop('Unnamed: 0')
+            .dropna(axis=1, how='all')
+            .dropna(axis=0, how='all')
+            .cast({'Country': 'category', 'Status': 'category', 'Year': 'Int16',
+                   'Mass (lb)': lambda column: pd.to_numeric(column.str.strip('<>'))})
+            .derive('Mass (kg)', lambda df: df['Mass (lb)'] / 2.205))
+df_clean = pipeline.run(pd.read_csv('data/objects-on-the-moon.csv'))
+df_clean.dtypes
+
+# %%
+pipeline.report
+
+# %% [markdown]
+# **pour aller plus loin**
+#
+# quand on reçoit non pas un mais des centaines de fichiers comme `objects-on-the-moon.csv`
+# (un par mission ou par agence), on peut les lire et les nettoyer **en parallèle**, dans plusieurs processus
+#
+# - chaque processus lit un fichier avec `read_with_schema`, puis range les colonnes dans des segments de
+#   **mémoire partagée** (`multiprocessing.shared_memory`): des tableaux `numpy` pour les nombres,
+#   les codes pour les `category`, et pour les chaines, comme un dictionnaire: un code par ligne,
+#   et les chaines distinctes mises bout à bout dans un seul tableau de caractères, plus leurs longueurs
+#   (dans l'esprit d'*Arrow*), le tout fabriqué et relu sans boucle `Python`;
+#   seule la description des segments revient par `pickle`, pas la dataframe
+# - le processus principal recolle les morceaux, colonne par colonne, en unifiant les catégories
+#   de `Country` et de `Status` d'un fichier à l'autre
+#
+# les fonctions définies dans le notebook ne sont connues des autres processus que s'ils sont créés par `fork`
+# (Linux, macOS), on le demande donc explicitement quand c'est possible
+
+# %%
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_all_start_methods, get_context, resource_tracker, shared_memory
+
+
+def _to_shared(array, created):
+    """
+    copie array dans un nouveau segment de mémoire partagée, ajouté à created
+    renvoie de quoi le retrouver
+    """
+    array = np.ascontiguousarray(array)
+    segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    created.append(segment.name)
+    np.ndarray(array.shape, array.dtype, buffer=segment.buf)[...] = array
+    segment.close()
+    return segment.name, array.dtype.str, array.shape
+
+
+def _unlink(names):
+    """libère des segments de mémoire partagée (ceux qui existent encore)"""
+    for name in names:
+        try:
+            segment = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            continue
+        segment.close()
+        segment.unlink()
+
+
+def _encode_strings(values):
+    """
+    les chaines de values mises bout à bout, en un seul tableau de caractères
+    (leurs codes unicode, en uint32), et leurs longueurs, sans boucle Python
+    les valeurs manquantes sont des chaines vides
+    """
+    text = values.fillna('').to_numpy(dtype=str)
+    lengths = np.char.str_len(text)
+    matrix = text.view(np.uint32).reshape(len(text), -1)
+    return matrix[np.arange(matrix.shape[1]) < lengths[:, None]], lengths
+
+
+def _decode_strings(data, lengths):
+    """l'inverse de _encode_strings, en un tableau de chaines"""
+    width = max(int(lengths.max(initial=0)), 1)
+    matrix = np.zeros((len(lengths), width), dtype=np.uint32)
+    matrix[np.arange(width) < lengths[:, None]] = data
+    return matrix.view(f'U{width}').ravel()
+
+
+def _share_frame(filename, schema):
+    """
+    (dans un processus du pool) lit et nettoie un fichier
+    renvoie son nombre de lignes, et par colonne: (genre, segments, catégories)
+    si quelque chose échoue en route, les segments déjà créés sont libérés
+    """
+    created = []
+    try:
+        df = read_with_schema(filename, schema)
+        columns = {'__index__': ('numeric', [_to_shared(df.index.to_numpy(), created)], None)}
+        for column, dtype in df.dtypes.items():
+            values = df[column]
+            missing = values.isna().to_numpy()
+            if isinstance(dtype, pd.CategoricalDtype):
+                columns[column] = ('category', [_to_shared(values.cat.codes.to_numpy(), created)],
+                                   list(dtype.categories))
+            elif pd.api.types.is_string_dtype(dtype):
+                # chaque chaine distincte n'est envoyée qu'une fois, plus un code par ligne
+                codes, uniques = pd.factorize(values)
+                data, lengths = _encode_strings(pd.Series(uniques, dtype=object))
+                columns[column] = ('string', [_to_shared(codes, created), _to_shared(data, created),
+                                              _to_shared(lengths, created)], None)
+            elif isinstance(dtype, pd.api.extensions.ExtensionDtype):
+                data = values.to_numpy(dtype=dtype.numpy_dtype, na_value=0)
+                columns[column] = ('masked', [_to_shared(data, created),
+                                              _to_shared(missing, created)], None)
+            else:
+                columns[column] = ('numeric', [_to_shared(values.to_numpy(), created)], None)
+    except BaseException:
+        _unlink(created)
+        raise
+    return len(df), columns
+
+
+MASKED_ARRAYS = {'i': pd.arrays.IntegerArray, 'u': pd.arrays.IntegerArray,
+                 'f': pd.arrays.FloatingArray, 'b': pd.arrays.BooleanArray}
+
+
+def _assemble(kind, parts):
+    """
+    recolle une colonne à partir des morceaux (longueur, tableaux, catégories) de chaque fichier
+    un fichier où la colonne manque (tableaux à None) donne des valeurs manquantes
+    """
+    present = [arrays for _, arrays, _ in parts if arrays is not None]
+    if kind == 'numeric':
+        dtype = np.result_type(*(arrays[0].dtype for arrays in present))
+        if not np.issubdtype(dtype, np.inexact) and len(present) < len(parts):
+            dtype = np.float64
+        return np.concatenate([
+            np.full(length, np.nan, dtype) if arrays is None else arrays[0]
+            for length, arrays, _ in parts]).astype(dtype, copy=False)
+    if kind == 'masked':
+        # les morceaux sans valeur manquante ont pu être lus en 'numeric', sans masque
+        dtype = np.result_type(*(arrays[0].dtype for arrays in present))
+        data = np.concatenate([np.zeros(length, dtype) if arrays is None else arrays[0]
+                               for length, arrays, _ in parts])
+        mask = np.concatenate([np.ones(length, bool) if arrays is None
+                               else arrays[1] if len(arrays) > 1 else np.zeros(length, bool)
+                               for length, arrays, _ in parts])
+        return MASKED_ARRAYS[dtype.kind](data, mask)
+    if kind == 'category':
+        categories = pd.Index(list(dict.fromkeys(
+            category for _, arrays, known in parts if arrays is not None for category in known)))
+        codes = []
+        for length, arrays, known in parts:
+            if arrays is None:
+                codes.append(np.full(length, -1, dtype=np.int64))
+                continue
+            # le dernier élément traduit le code -1 (valeur manquante)
+            mapping = np.append(categories.get_indexer(known), -1)
+            codes.append(mapping[arrays[0]])
+        return pd.Categorical.from_codes(np.concatenate(codes), categories)
+    # kind == 'string': on décode d'un coup les chaines distinctes de tous les fichiers,
+    # et chaque ligne va les chercher par son code, décalé selon le fichier
+    data = np.concatenate([arrays[1] for arrays in present])
+    lengths = np.concatenate([arrays[2] for arrays in present])
+    uniques = pd.Series(_decode_strings(data, lengths).astype(object)).array
+    codes, offset = [], 0
+    for length, arrays, _ in parts:
+        if arrays is None:
+            codes.append(np.full(length, -1, dtype=np.intp))
+            continue
+        codes.append(np.where(arrays[0] >= 0, arrays[0] + offset, -1))
+        offset += len(arrays[2])
+    return uniques.take(np.concatenate(codes), allow_fill=True)
+
+
+def read_many(filenames, schema, max_workers=None):
+    """
+    lit et nettoie les fichiers en parallèle (un fichier par tâche)
+    l'index du résultat est (nom du fichier, numéro de ligne dans le fichier)
+    """
+    filenames = list(filenames)
+    context = get_context('fork') if 'fork' in get_all_start_methods() else None
+    # les processus du pool partagent ainsi le suivi des segments du processus principal,
+    # qui les libère si jamais il s'arrête sans l'avoir fait
+    resource_tracker.ensure_running()
+    results, received, error = [None] * len(filenames), [], None
+    segments = []
+
+    def attach(name, dtype, shape):
+        segment = shared_memory.SharedMemory(name=name)
+        segments.append(segment)
+        return np.ndarray(shape, dtype, buffer=segment.buf)
+
+    try:
+        with ProcessPoolExecutor(max_workers or os.cpu_count(), mp_context=context) as pool:
+            futures = {pool.submit(_share_frame, filename, schema): rank
+                       for rank, filename in enumerate(filenames)}
+            # on va jusqu'au bout même après une erreur,
+            # pour connaître (et libérer) les segments des autres fichiers
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as exc:
+                    if error is None:
+                        error = exc
+                        for pending in futures:
+                            pending.cancel()
+                    continue
+                results[futures[future]] = result
+                received.extend(buffer[0] for _, buffers, _ in result[1].values()
+                                for buffer in buffers)
+        if error is not None:
+            raise error
+        kinds = {}
+        for _, columns in results:
+            for column, (kind, _, _) in columns.items():
+                if kinds.setdefault(column, kind) == 'numeric' and kind == 'masked':
+                    kinds[column] = kind
+        data = {}
+        for column, kind in kinds.items():
+            parts = []
+            for length, columns in results:
+                if column in columns:
+                    _, buffers, categories = columns[column]
+                    parts.append((length, [attach(*buffer) for buffer in buffers], categories))
+                else:
+                    parts.append((length, None, None))
+            data[column] = _assemble(kind, parts)
+            del parts
+    finally:
+        for segment in segments:
+            segment.close()
+        _unlink(received)
+    lengths = [length for length, _ in results]
+    names = [os.path.splitext(os.path.basename(filename))[0] for filename in filenames]
+    index = pd.MultiIndex.from_arrays([np.repeat(names, lengths), data.pop('__index__')])
+    return pd.DataFrame(data, index=index)
+
+
+# %%
+# ici un seul fichier, mais le principe est le même avec des centaines
+df_many = read_many(sorted(glob.glob('data/objects-on-the-*.csv')), MOON_SCHEMA)
+df_many.dtypes
+
 # %% [markdown]
 # 8. 1. la colonne des masses n'est pas de type numérique mais de type `object`  
 #       (ici des `str`)   
@@ -131,6 +560,120 @@ df.dtypes
 # votre code
 df['Mass (lb)'].unique()
 
+# %% [markdown]
+# **pour aller plus loin**
+#
+# `info()`, `dtypes` puis `unique()` colonne par colonne, c'est autant de passes sur les données,
+# et `unique()` affiche *toutes* les valeurs distinctes: pas très utile sur un fichier de plusieurs millions de lignes
+#
+# on peut plutôt faire un **profil** de chaque colonne, en une seule passe sur des morceaux du fichier
+# (qui n'a donc pas besoin de tenir en mémoire), en ne gardant par colonne qu'un petit résumé:
+# - le nombre de valeurs manquantes
+# - le type deviné: `int`, `float`, `str`, ou `mixed` quand seule une partie des valeurs sont des nombres
+# - quelques exemples de valeurs qui ne sont pas des nombres (comme `<12626`)
+# - le nombre de valeurs distinctes: exact tant qu'il y en a peu, puis estimé avec un *HyperLogLog*
+#   (un tableau de $2^{12}$ petits entiers, quelle que soit la taille du fichier, pour environ 2% d'erreur)
+# - le min et le max des valeurs numériques
+
+# %%
+class ColumnProfile:
+    """
+    le résumé d'une colonne, mis à jour morceau par morceau avec update
+    la mémoire utilisée est bornée: 2**precision registres, au plus exact
+    hashs gardés pour compter exactement, et au plus samples exemples
+    """
+
+    def __init__(self, precision=12, exact=10_000, samples=5):
+        self.precision = precision
+        self.registers = np.zeros(2 ** precision, dtype=np.uint8)
+        self.hashes, self.exact = set(), exact
+        self.samples, self.bad = samples, []
+        self.count = self.nulls = self.numbers = self.integers = 0
+        self.min, self.max = np.inf, -np.inf
+
+    def update(self, values):
+        self.count += len(values)
+        self.nulls += values.isna().sum()
+        values = values.dropna()
+        if pd.api.types.is_numeric_dtype(values.dtype):
+            parsed = values.to_numpy(dtype=float)
+        else:
+            parsed = pd.to_numeric(values.astype(str).str.strip(), errors='coerce').to_numpy(dtype=float)
+        numbers = ~np.isnan(parsed)
+        self.numbers += numbers.sum()
+        self.integers += (parsed[numbers] == np.round(parsed[numbers])).sum()
+        if numbers.any():
+            self.min = min(self.min, parsed[numbers].min())
+            self.max = max(self.max, parsed[numbers].max())
+        for value in values[~numbers].unique()[:self.samples - len(self.bad)]:
+            if value not in self.bad:
+                self.bad.append(value)
+        self._add_hashes(pd.util.hash_pandas_object(values, index=False).to_numpy())
+
+    def _add_hashes(self, hashes):
+        if self.hashes is not None:
+            self.hashes.update(hashes.tolist())
+            if len(self.hashes) > self.exact:
+                self.hashes = None
+        # HyperLogLog: les premiers bits choisissent un registre, qui garde
+        # le plus grand rang du premier bit à 1 parmi les bits restants
+        rest_bits = 64 - self.precision
+        registers = (hashes >> np.uint64(rest_bits)).astype(np.intp)
+        rest = hashes & np.uint64((1 << rest_bits) - 1)
+        _, length = np.frexp(rest.astype(np.float64))
+        np.maximum.at(self.registers, registers, (rest_bits - length + 1).astype(np.uint8))
+
+    def distinct(self):
+        """le nombre de valeurs distinctes, exact ou estimé"""
+        if self.hashes is not None:
+            return len(self.hashes)
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(2.0 ** -self.registers.astype(float))
+        zeros = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+    def inferred_type(self):
+        present = self.count - self.nulls
+        if present == 0:
+            return 'empty'
+        if self.numbers == 0:
+            return 'str'
+        if self.numbers < present:
+            return 'mixed'
+        return 'int' if self.integers == present else 'float'
+
+    def summary(self):
+        numeric = self.numbers > 0
+        return {'count': self.count, 'nulls': self.nulls, 'type': self.inferred_type(),
+                'distinct': self.distinct(), 'exact': self.hashes is not None,
+                'min': self.min if numeric else np.nan, 'max': self.max if numeric else np.nan,
+                'bad samples': self.bad if numeric else []}
+
+
+def profile(chunks, **kwds):
+    """le profil (une ligne par colonne) d'une suite de dataframes, en une passe"""
+    profiles = {}
+    for chunk in chunks:
+        for column in chunk.columns:
+            profiles.setdefault(column, ColumnProfile(**kwds)).update(chunk[column])
+    return pd.DataFrame({column: profile.summary()
+                         for column, profile in profiles.items()}).T
+
+
+def profile_csv(filename, chunksize=100_000, **kwds):
+    """le profil d'un csv lu par morceaux, toutes les colonnes lues comme des chaines"""
+    return profile(pd.read_csv(filename, dtype=str, chunksize=chunksize), **kwds)
+
+
+# %%
+profile_csv('data/objects-on-the-moon.csv', chunksize=20)
+
+# %%
+# ça marche aussi sur une dataframe déjà chargée
+profile([df])
+
 # %% [markdown]
 # 9. 1. conservez la colonne `'Mass (lb)'` d'origine  
 #       (par exemple dans une colonne de nom `'Mass (lb) orig'`)  
@@ -171,6 +714,39 @@ df['Mass (lb) orig'] = df['Mass (lb) orig'].astype(str)
 df['Mass (lb) orig'] = df['Mass (lb) orig'].str.replace('<', '').str.replace('>', '')
 df['Mass (lb) orig'] = df['Mass (lb) orig'].astype(float).astype(int)
 
+# %% [markdown]
+# **pour aller plus loin**
+#
+# en enlevant les `<` et les `>` on perd une information: `<12626` veut dire *au plus* 12626
+# et chaque étape (`astype(str)`, `str.replace`, `astype(float)`, ...) fabrique une nouvelle colonne complète
+#
+# on peut à la place découper chaque chaine **en une seule passe** avec une expression régulière (`str.extract`)
+# et ranger le qualificatif dans une petite colonne d'entiers sur 8 bits: `-1` pour `<`, `0` pour une valeur exacte, `1` pour `>`
+
+# %%
+QUALIFIERS = {'<': -1, '>': 1}
+
+
+def parse_qualified(column):
+    """
+    découpe des chaines comme '<100', '>2000' ou '860'
+    en une valeur (float) et un qualificatif (int8: -1 pour <, 0 pour =, 1 pour >)
+    """
+    parts = column.str.extract(r'^\s*([<>]?)\s*(\d+(?:\.\d*)?)\s*$')
+    signs = parts[0]
+    qualifier = np.zeros(len(column), dtype=np.int8)
+    for sign, code in QUALIFIERS.items():
+        qualifier[signs.eq(sign).to_numpy(dtype=bool, na_value=False)] = code
+    return pd.DataFrame({'value': pd.to_numeric(parts[1]),
+                         'qualifier': qualifier}, index=column.index)
+
+
+# %%
+# les chaines d'origine ont été modifiées plus haut, on les relit
+raw = pd.read_csv('data/objects-on-the-moon.csv')['Mass (lb)']
+mass = parse_qualified(raw)
+mass[mass['qualifier'] != 0]
+
 # %% [markdown]
 # 11. 1. sachant `1 kg = 2.205 lb`  
 #    créez une nouvelle colonne `'Mass (kg)'` en convertissant les lb en kg  
@@ -181,6 +757,66 @@ df['Mass (lb) orig'] = df['Mass (lb) orig'].astype(float).astype(int)
 df['Mass (kg)'] = df['Mass (lb)'] / 2.205
 df['Mass (kg)'] = df['Mass (kg)'].round().astype(int)
 
+# %% [markdown]
+# **pour aller plus loin**
+#
+# avec deux colonnes `'Mass (lb)'` et `'Mass (kg)'` on range deux fois la même information
+# et en arrondissant à l'entier *avant* de sommer, on cumule les erreurs d'arrondi
+#
+# on peut plutôt garder **un seul** tableau, dans son unité d'origine, et ne convertir que
+# quand on en a besoin: à la demande pour la colonne entière, ou seulement sur le résultat
+# (un scalaire, ou une valeur par pays) quand on fait une somme
+
+# %%
+MASS_UNITS = {'lb': 1 / 2.205, 'kg': 1.}   # en kg
+
+
+class UnitColumn:
+    """
+    un tableau de mesures, rangé une seule fois dans l'unité unit
+    units donne la valeur de chaque unité dans une unité de référence commune
+    """
+
+    def __init__(self, values, unit, units=MASS_UNITS, name=None):
+        self.values = pd.Series(values).to_numpy(dtype=float)
+        self.index = getattr(values, 'index', pd.RangeIndex(len(self.values)))
+        self.unit = unit
+        self.units = units
+        self.name = name if name is not None else getattr(values, 'name', None)
+
+    def __len__(self):
+        return len(self.values)
+
+    def factor(self, unit):
+        """par combien multiplier une valeur en self.unit pour l'avoir en unit"""
+        return self.units[self.unit] / self.units[unit]
+
+    def to(self, unit):
+        """la colonne convertie en unit, calculée à la demande (rien n'est gardé)"""
+        values = self.values if unit == self.unit else self.values * self.factor(unit)
+        return pd.Series(values, index=self.index, name=f"{self.name} ({unit})")
+
+    def __getitem__(self, unit):
+        return self.to(unit)
+
+    def sum(self, unit=None):
+        """la somme, calculée dans l'unité de stockage puis convertie"""
+        return np.nansum(self.values) * self.factor(unit or self.unit)
+
+    def sum_by(self, column, unit=None):
+        """la somme par catégorie de column, convertie seulement à la fin"""
+        sums = sum_by(column, pd.Series(self.values, index=self.index))
+        return (sums * self.factor(unit or self.unit)).rename(self.name)
+
+
+# %%
+# une seule colonne, en lb comme dans le fichier
+masses = UnitColumn(df['Mass (lb)'], 'lb', name='Mass')
+masses['kg'].head()
+
+# %%
+masses.sum('kg'), masses.sum('lb')
+
 # %% [markdown]
 # 12. 1. Quels sont les pays qui ont laissé des objets sur la lune ?
 #     2. Combien en ont-ils laissé en pourcentage (pas en nombre) ?  
@@ -204,6 +840,75 @@ m_us = df[df['Country'] == 'United States']['Mass (kg)'].sum()
 print(f"Poids total des objets sur la Lune : {total_weight} kg")
 print(f"Poids total des objets laissés par les États-Unis : {us_weight} kg")
 
+# %% [markdown]
+# **pour aller plus loin**
+#
+# les colonnes `Country` et `Status` ne contiennent qu'une poignée de valeurs différentes, répétées sur toutes les lignes
+# avec le type `category`, `pandas` range une seule fois chaque valeur (les *catégories*) et, par ligne, un petit entier (le *code*)
+#
+# - on peut le faire automatiquement pour toutes les colonnes de chaines qui ont peu de valeurs distinctes
+# - et une fois qu'on a des codes entiers, compter ou sommer par catégorie, c'est juste un `np.bincount`
+
+# %%
+def encode_low_cardinality(df, max_ratio=0.5):
+    """
+    convertit en category (en place) les colonnes de chaines
+    dont le nombre de valeurs distinctes est au plus max_ratio fois le nombre de lignes
+    """
+    for column, dtype in df.dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype) or not pd.api.types.is_string_dtype(dtype):
+            continue
+        if df[column].nunique() <= max_ratio * len(df):
+            df[column] = df[column].astype('category')
+    return df
+
+
+def count_by(column, normalize=False):
+    """
+    l'équivalent de column.value_counts(normalize) sur une colonne category
+    """
+    codes = column.cat.codes.to_numpy()
+    counts = np.bincount(codes[codes >= 0], minlength=len(column.cat.categories))
+    result = pd.Series(counts, index=column.cat.categories, name='count')
+    if normalize:
+        result = (result / result.sum()).rename('proportion')
+    return result.sort_values(ascending=False, kind='stable')
+
+
+def sum_by(column, values):
+    """
+    la somme de values par catégorie de column (une colonne category)
+    """
+    codes = column.cat.codes.to_numpy()
+    weights = values.to_numpy(dtype=float)
+    keep = (codes >= 0) & ~np.isnan(weights)
+    sums = np.bincount(codes[keep], weights=weights[keep],
+                       minlength=len(column.cat.categories))
+    return pd.Series(sums, index=column.cat.categories, name=values.name)
+
+
+# %%
+before = df.memory_usage(deep=True).sum()
+encode_low_cardinality(df)
+df.dtypes, before, df.memory_usage(deep=True).sum()
+
+# %%
+# c'est aussi une option du chargement par schéma
+read_with_schema('data/objects-on-the-moon.csv', MOON_SCHEMA, max_ratio=0.5).dtypes
+
+# %%
+# le pourcentage par pays
+count_by(df['Country'], normalize=True) * 100
+
+# %%
+# la masse totale par pays, et celle des United States
+mass_by_country = sum_by(df['Country'], df['Mass (kg)'])
+mass_by_country.sum(), mass_by_country['United States']
+
+# %%
+# pareil sans colonne 'Mass (kg)' ni arrondi: on somme les lb, et on convertit les totaux
+masses.sum_by(df['Country'], 'kg')['United States'], masses.sum('kg')
+
 # %% [markdown]
 # 14. 1. quel pays a laissé l'objet le plus léger ?  
 #      *hint* comme il existe une méthode `min` des séries, il existe une méthode `argmin` 
@@ -237,6 +942,77 @@ if not memorial.empty:
 else:
     print("Il n'y a pas de mémorial sur la Lune.")
 
+# %% [markdown]
+# **pour aller plus loin**
+#
+# `str.contains` parcourt **toutes** les chaines à chaque recherche; si on a des milliers de mots à chercher, ça devient coûteux
+#
+# on peut construire une fois pour toutes un *index inversé*, comme un moteur de recherche:
+# - on découpe chaque description en mots (en minuscules)
+# - et pour chaque mot on range la liste des numéros de lignes où il apparait
+#
+# chercher un mot, c'est alors juste un accès dans un dictionnaire
+# et en gardant aussi la liste triée des mots, on trouve les mots qui commencent par un préfixe avec `bisect`
+
+# %%
+import re
+from bisect import bisect_left
+from heapq import merge
+
+WORD = re.compile(r'\w+')
+
+
+class TextIndex:
+    """
+    un index inversé des mots d'une colonne de textes
+    les recherches ne tiennent pas compte de la casse
+    et retournent des numéros de lignes (positions, comme pour iloc)
+    """
+
+    def __init__(self, column=()):
+        self.postings = {}      # mot -> liste croissante de positions
+        self.words = []         # les mots, triés
+        self.size = 0
+        self.append(column)
+
+    def append(self, texts):
+        """ajoute des textes à la fin (les valeurs manquantes sont ignorées)"""
+        new = []
+        for text in texts:
+            if isinstance(text, str):
+                for word in set(WORD.findall(text.lower())):
+                    if word not in self.postings:
+                        self.postings[word] = []
+                        new.append(word)
+                    self.postings[word].append(self.size)
+            self.size += 1
+        # une seule fusion à la fin, plutôt qu'une insertion par nouveau mot
+        if new:
+            self.words = list(merge(self.words, sorted(new)))
+
+    def search(self, word):
+        """les positions des textes qui contiennent ce mot"""
+        return np.array(self.postings.get(word.lower(), []), dtype=np.int64)
+
+    def search_prefix(self, prefix):
+        """les positions des textes qui contiennent un mot commençant par prefix"""
+        prefix = prefix.lower()
+        start = bisect_left(self.words, prefix)
+        stop = bisect_left(self.words, prefix + '\U0010ffff')
+        found = [self.postings[word] for word in self.words[start:stop]]
+        if not found:
+            return np.array([], dtype=np.int64)
+        return np.unique(np.concatenate(found))
+
+
+# %%
+text_index = TextIndex(df['Artificial object'])
+df.iloc[text_index.search('memorial')]
+
+# %%
+# tous les objets "Lunar ..." (Lunar Orbiter, Lunar Prospector, Lunar Roving Vehicle, ...)
+df.iloc[text_index.search_prefix('lun')]['Artificial object'].tolist()
+
 
 # %% [markdown]
 # 16. 1. faites la liste Python des objets sur la lune  
@@ -250,5 +1026,291 @@ object_on_moon = df['Artificial object'].tolist()
 # Afficher la liste
 print(object_on_moon)
 
+# %% [markdown]
+# **pour aller plus loin**
+#
+# les questions 12 à 16 relisent chacune la dataframe: `value_counts`, deux `sum`, `argmin`, `str.contains`, `tolist`
+# si on doit produire ce même rapport sur des millions de lignes, on a intérêt à **regrouper** les requêtes:
+# - on parcourt les lignes **une seule fois**, par blocs, et chaque bloc met à jour les accumulateurs de **toutes** les requêtes
+# - les comptages et les sommes par valeur d'une clé passent par des codes entiers (avec `pd.factorize`, bloc par bloc) et `np.bincount`
+# - les `argmin` / `argmax` gardent juste le meilleur candidat vu jusqu'ici
+# - les recherches de mots se font sur chaque bloc; et si on a déjà un `TextIndex` (ci-dessus) pour la colonne, on le passe en paramètre et on n'a plus rien à parcourir
+#
+# une requête est un tuple dont le premier élément est son type:
+#
+# | requête | résultat |
+# |-|-|
+# | `('count', key)` | le nombre de lignes par valeur de `key` |
+# | `('sum', column)` ou `('sum', column, key)` | la somme de `column`, au total ou par valeur de `key` |
+# | `('argmin', column, *payload)` et `('argmax', ...)` | la ligne du min (ou du max), avec les colonnes de `payload` |
+# | `('contains', column, word)` | les index des lignes dont `column` contient le mot `word` |
+# | `('list', column)` | la liste Python des valeurs |
+
+# %%
+def batch_query(df, queries, text_indexes=None, block=1 << 16):
+    """
+    évalue un dictionnaire nom -> requête
+    et retourne un dictionnaire nom -> résultat
+
+    toutes les requêtes sont évaluées en un seul parcours des lignes, par blocs de block lignes
+    text_indexes est un dictionnaire optionnel colonne -> TextIndex déjà construit
+    """
+    text_indexes = text_indexes or {}
+    tables = {}     # clé -> dictionnaire valeur -> code, dans l'ordre d'apparition
+    states = {}
+    for name, (kind, *args) in queries.items():
+        if kind == 'count':
+            tables.setdefault(args[0], {})
+            states[name] = np.zeros(0, dtype=np.int64)
+        elif kind == 'sum' and len(args) == 2:
+            tables.setdefault(args[1], {})
+            states[name] = np.zeros(0)
+        elif kind == 'sum':
+            states[name] = 0.0
+        elif kind in ('argmin', 'argmax'):
+            states[name] = (np.nan, -1)         # meilleure valeur, et sa position
+        elif kind == 'contains' and args[0] in text_indexes:
+            states[name] = text_indexes[args[0]].search(args[1])
+        elif kind in ('contains', 'list'):
+            states[name] = []
+        else:
+            raise ValueError(f"unknown query {kind}")
+
+    def encode(key, rows):
+        # les codes du bloc, traduits en codes globaux (-1 pour les valeurs manquantes)
+        local, uniques = pd.factorize(df[key].iloc[rows])
+        table = tables[key]
+        mapping = np.array([table.setdefault(value, len(table)) for value in uniques] + [-1])
+        return mapping[local]
+
+    def accumulate(total, codes, size, weights=None):
+        keep = codes >= 0
+        if weights is not None:
+            keep &= ~np.isnan(weights)
+            weights = weights[keep]
+        counts = np.zeros(size, dtype=total.dtype)
+        counts[:len(total)] = total
+        counts += np.bincount(codes[keep], weights=weights, minlength=size)
+        return counts
+
+    for start in range(0, len(df), block):
+        rows = slice(start, start + block)
+        # chaque colonne n'est extraite, et chaque clé codée, qu'une fois par bloc
+        arrays = {column: df[column].iloc[rows].to_numpy(dtype=float)
+                  for kind, column, *_ in queries.values()
+                  if kind in ('sum', 'argmin', 'argmax')}
+        codes = {key: encode(key, rows) for key in tables}
+        for name, (kind, *args) in queries.items():
+            if kind == 'count':
+                key, = args
+                states[name] = accumulate(states[name], codes[key], len(tables[key]))
+            elif kind == 'sum' and len(args) == 2:
+                column, key = args
+                states[name] = accumulate(states[name], codes[key], len(tables[key]),
+                                          arrays[column])
+            elif kind == 'sum':
+                states[name] += np.nansum(arrays[args[0]])
+            elif kind in ('argmin', 'argmax'):
+                values = arrays[args[0]]
+                if np.isnan(values).all():
+                    continue
+                position = np.nanargmin(values) if kind == 'argmin' else np.nanargmax(values)
+                best, _ = states[name]
+                better = values[position] < best if kind == 'argmin' else values[position] > best
+                if np.isnan(best) or better:
+                    states[name] = (values[position], start + position)
+            elif kind == 'contains' and args[0] not in text_indexes:
+                column, word = args
+                texts = df[column].iloc[rows]
+                # une recherche de sous-chaine, puis on ne garde que les mots entiers
+                # (sans tenir compte de la casse, comme pour TextIndex)
+                candidates = np.flatnonzero(
+                    texts.str.contains(word, case=False, regex=False, na=False).to_numpy())
+                exact = texts.iloc[candidates].str.contains(
+                    rf'(?<!\w){re.escape(word)}(?!\w)', case=False, na=False)
+                states[name].extend(start + candidates[exact.to_numpy()])
+            elif kind == 'list':
+                states[name].extend(df[args[0]].iloc[rows].tolist())
+
+    results = {}
+    for name, (kind, *args) in queries.items():
+        state = states[name]
+        if kind == 'count' or kind == 'sum' and len(args) == 2:
+            key = args[-1]
+            result = pd.Series(state, index=pd.Index(list(tables[key]), name=key))
+            results[name] = (result.sort_values(ascending=False, kind='stable')
+                             if kind == 'count' else result.rename(args[0]))
+        elif kind in ('argmin', 'argmax'):
+            column, *payload = args
+            value, position = state
+            if position < 0:
+                raise ValueError(f"{kind}: no value in {column}")
+            results[name] = {'index': df.index[position], column: value,
+                             **{other: df[other].iloc[position] for other in payload}}
+        elif kind == 'contains':
+            results[name] = df.index[np.asarray(state, dtype=np.int64)]
+        else:
+            results[name] = state
+    return results
+
+
+# %%
+report = batch_query(df, {
+    'objects_per_country': ('count', 'Country'),
+    'total_mass': ('sum', 'Mass (kg)'),
+    'mass_per_country': ('sum', 'Mass (kg)', 'Country'),
+    'lightest': ('argmin', 'Mass (kg)', 'Country', 'Artificial object'),
+    'memorials': ('contains', 'Artificial object', 'memorial'),
+    'objects': ('list', 'Artificial object'),
+})
+(report['objects_per_country'] / len(df) * 100,
+ report['total_mass'], report['mass_per_country']['United States'],
+ report['lightest'], df.loc[report['memorials'], 'Country'].tolist())
+
+# %%
+# avec l'index de mots déjà construit, la recherche ne parcourt plus les descriptions
+batch_query(df, {'memorials': ('contains', 'Artificial object', 'memorial')},
+            text_indexes={'Artificial object': text_index})
+
+# %% [markdown]
+# **pour aller plus loin**
+#
+# la colonne `Location` contient les coordonnées des objets, sous deux formes:
+# en degrés-minutes-secondes puis en degrés décimaux, séparées par un `/` (et des caractères invisibles, `'\ufeff'`)
+# ```
+# 9°21′29″N 21°28′48″E / 9.358°N 21.480°E
+# ```
+# 1. on en extrait la latitude et la longitude en degrés décimaux (positifs vers le nord et l'est),
+#    avec `str.extract`: en priorité la partie décimale, et sinon la partie en degrés-minutes-secondes
+# 1. puis on range les objets dans une grille de cases de quelques degrés, pour retrouver
+#    les objets dans un rectangle, ou l'objet le plus proche d'un point, sans tout parcourir
+
+# %%
+MOON_RADIUS = 1737.4    # en km
+INVISIBLE = '[\ufeff\u200b\u200c\u200d\u2060]'
+# la partie décimale: après le /, ou bien seule dans la chaine
+DECIMAL = r'(?:^|/)\s*(\d+(?:\.\d+)?)°([NS])\s*(\d+(?:\.\d+)?)°([EW])\s*$'
+DMS = r'^\s*(\d+)°(?:(\d+)′)?(?:(\d+)″)?([NS])\s*(\d+)°(?:(\d+)′)?(?:(\d+)″)?([EW])'
+
+
+def parse_location(column):
+    """
+    les latitudes et longitudes (float64, en degrés) d'une colonne comme Location
+    NaN quand la position est inconnue
+    """
+    text = column.str.replace(INVISIBLE, '', regex=True)
+    decimal = text.str.extract(DECIMAL)
+    dms = text.str.extract(DMS)
+
+    def degrees(parts):
+        return sum(pd.to_numeric(part).fillna(0) / factor
+                   for part, factor in zip(parts, (1, 60, 3600))
+                   ).where(parts[0].notna())
+
+    def signed(values, hemisphere, negative):
+        return values.where(hemisphere != negative, -values)
+
+    lat = signed(pd.to_numeric(decimal[0]), decimal[1], 'S').fillna(
+        signed(degrees([dms[0], dms[1], dms[2]]), dms[3], 'S'))
+    lon = signed(pd.to_numeric(decimal[2]), decimal[3], 'W').fillna(
+        signed(degrees([dms[4], dms[5], dms[6]]), dms[7], 'W'))
+    return pd.DataFrame({'lat': lat.astype(float), 'lon': lon.astype(float)})
+
+
+def surface_distance(lat1, lon1, lat2, lon2, radius=MOON_RADIUS):
+    """la distance à la surface (formule de haversine), en km"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * radius * np.arcsin(np.sqrt(np.minimum(a, 1)))
+
+
+class GridIndex:
+    """
+    range des points (lat, lon) dans une grille de cases de cell degrés
+
+    les points d'une même case sont contigus dans self.order,
+    entre self.bounds[case] et self.bounds[case + 1]
+    """
+
+    def __init__(self, lat, lon, cell=10.):
+        self.lat = np.asarray(lat, dtype=float)
+        self.lon = np.asarray(lon, dtype=float)
+        self.cell = cell
+        self.nrows = int(np.ceil(180 / cell))
+        self.ncols = int(np.ceil(360 / cell))
+        known = np.flatnonzero(~np.isnan(self.lat) & ~np.isnan(self.lon))
+        cells = self._row(self.lat[known]) * self.ncols + self._col(self.lon[known])
+        order = np.argsort(cells, kind='stable')
+        self.order = known[order]
+        self.bounds = np.searchsorted(cells[order], np.arange(self.nrows * self.ncols + 1))
+
+    def _row(self, lat):
+        return np.clip(((lat + 90) // self.cell).astype(int), 0, self.nrows - 1)
+
+    def _col(self, lon):
+        return (((lon + 180) % 360) // self.cell).astype(int)
+
+    def _candidates(self, lat_min, lat_max, lon_min, lon_max):
+        """les points des cases qui touchent le rectangle"""
+        rows = np.arange(self._row(np.float64(lat_min)), self._row(np.float64(lat_max)) + 1)
+        if lon_max - lon_min >= 360 - self.cell:
+            cols = np.arange(self.ncols)
+        else:
+            first, last = self._col(np.float64(lon_min)), self._col(np.float64(lon_max))
+            cols = np.arange(first, last + 1 if last >= first else last + 1 + self.ncols) % self.ncols
+        cells = (rows[:, None] * self.ncols + cols[None, :]).ravel()
+        found = [self.order[self.bounds[cell]:self.bounds[cell + 1]] for cell in cells]
+        return np.concatenate(found) if found else np.array([], dtype=int)
+
+    def bbox(self, lat_min, lat_max, lon_min, lon_max):
+        """
+        les positions des points dans le rectangle (bornes incluses)
+        si lon_min > lon_max, le rectangle traverse le méridien 180°
+        """
+        width = 360 if lon_max - lon_min >= 360 else (lon_max - lon_min) % 360
+        candidates = self._candidates(lat_min, lat_max, lon_min, lon_min + width)
+        lat, lon = self.lat[candidates], self.lon[candidates]
+        inside = ((lat >= lat_min) & (lat <= lat_max)
+                  & ((lon - lon_min) % 360 <= width))
+        return np.sort(candidates[inside])
+
+    def nearest(self, lat, lon):
+        """la position du point le plus proche, et sa distance en km"""
+        radius = self.cell
+        while True:
+            # un point à moins de radius degrés (d'arc) est dans ce rectangle
+            if abs(lat) + radius >= 90:
+                spread = 180
+            else:
+                spread = min(np.degrees(np.arcsin(np.sin(np.radians(radius))
+                                                  / np.cos(np.radians(abs(lat))))), 180)
+            candidates = self._candidates(lat - radius, lat + radius,
+                                          lon - spread, lon + spread)
+            if len(candidates):
+                distances = surface_distance(lat, lon, self.lat[candidates], self.lon[candidates])
+                best = distances.argmin()
+                if distances[best] <= np.radians(radius) * MOON_RADIUS:
+                    return candidates[best], distances[best]
+            if radius >= 180:
+                return None, np.nan
+            radius *= 2
+
+
+# %%
+positions = parse_location(df['Location'])
+positions.head()
+
+# %%
+grid = GridIndex(positions['lat'], positions['lon'])
+
+# les objets les plus proches du site d'Apollo 11 (0.674°N 23.473°E)
+closest, distance = grid.nearest(0.674, 23.473)
+df.iloc[closest]['Artificial object'], distance
+
+# %%
+# les objets près du pôle sud
+df.iloc[grid.bbox(-90, -80, -180, 180)]['Artificial object'].tolist()
+
 # %% [markdown]
 # ***
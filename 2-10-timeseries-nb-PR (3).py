@@ -182,6 +182,105 @@ df['Date']=pd.to_datetime(df['Date'])
 # %%
 df['Date'].dtype
 
+# %% [markdown]
+# ### pour les avancés: deviner le format une seule fois
+#
+# ````{admonition} →
+#
+# quand on ne connait pas le format à l'avance, on peut le deviner **une fois pour toute la colonne**
+# sur un échantillon, puis décoder toute la colonne avec ce format fixe
+#
+# - `pandas` fournit `guess_datetime_format` qui devine le format d'**une** chaine
+# - on prend le format le plus fréquent sur l'échantillon, et on vérifie qu'il décode bien (presque) tout l'échantillon
+# - ensuite `to_datetime(..., format=...)` fait un traitement vectorisé, sans deviner ligne par ligne
+# - et on récupère au passage les lignes qui n'ont pas pu être décodées
+# ````
+
+# %%
+from pandas.tseries.api import guess_datetime_format
+
+
+def infer_date_format(column, sample_size=200, min_ratio=0.9,
+                      dayfirst=False, seed=0):
+    """
+    devine le format de dates d'une colonne de chaines
+
+    on échantillonne sample_size valeurs non manquantes, on garde le format
+    le plus fréquemment deviné, et on vérifie qu'il décode au moins
+    une proportion min_ratio de l'échantillon; sinon ValueError
+    """
+    sample = column.dropna()
+    if len(sample) > sample_size:
+        sample = sample.sample(sample_size, random_state=seed)
+    guesses = sample.map(
+        lambda text: guess_datetime_format(text, dayfirst=dayfirst)).dropna()
+    if guesses.empty:
+        raise ValueError("no date format could be guessed")
+    date_format = guesses.value_counts().index[0]
+    parsed = pd.to_datetime(sample, format=date_format, errors='coerce')
+    ratio = parsed.notna().mean()
+    if ratio < min_ratio:
+        raise ValueError(f"format {date_format!r} only parses "
+                         f"{ratio:.0%} of the sample")
+    return date_format
+
+
+def parse_dates(column, date_format=None, **kwds):
+    """
+    décode une colonne de dates avec un format unique
+    (deviné par infer_date_format si date_format n'est pas fourni)
+
+    retourne les dates, et les valeurs d'origine qui n'ont pas pu être décodées
+    """
+    if date_format is None:
+        date_format = infer_date_format(column, **kwds)
+    dates = pd.to_datetime(column, format=date_format, errors='coerce')
+    failed = column[dates.isna() & column.notna()]
+    return dates, failed
+
+
+# %%
+raw = pd.read_csv('data/Amazon.csv', skiprows=3)['Date']
+infer_date_format(raw)
+
+# %%
+# les valeurs qui n'ont pas pu être décodées
+# (les cases vides ou 'null' sont déjà des NaN au sortir de read_csv)
+dates, failed = parse_dates(raw)
+failed
+
+# %% [markdown]
+# et pour comparer les vitesses, sur des données synthétiques:
+# - `format='mixed'` force le décodage ligne par ligne, en devinant le format à chaque fois
+# - depuis `pandas` 2, par défaut `to_datetime` devine le format sur la première valeur seulement, sans le valider sur le reste de la colonne
+
+# %%
+import time
+
+
+def best_time(function, *args, repeat=3, **kwds):
+    """
+    le meilleur temps (en secondes) sur repeat appels de function
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args, **kwds)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+# %%
+strings = pd.Series(
+    pd.date_range('2000-01-01', periods=50_000, freq='37min')
+      .strftime('%d/%m/%Y %H:%M'))
+
+{
+    'mixed': best_time(pd.to_datetime, strings, format='mixed', dayfirst=True),
+    'default': best_time(pd.to_datetime, strings, dayfirst=True),
+    'parse_dates': best_time(parse_dates, strings, dayfirst=True),
+}
+
 # %% [markdown]
 # ### exercice 3: `NaT`
 
@@ -244,6 +343,60 @@ df
 df=df.set_index('Date')
 df
 
+# %% [markdown]
+# ### pour les gros fichiers: lecture par morceaux
+#
+# ````{admonition} →
+#
+# avec 5852 lignes on peut tout lire d'un coup, puis convertir, puis faire le `dropna`
+# mais sur un historique de plusieurs Go, on n'a plus la place de garder en mémoire le texte **et** la version convertie
+#
+# `read_csv` accepte un paramètre `chunksize`: on obtient alors un itérateur sur des morceaux de la dataframe
+# on peut faire tout le travail des exercices 1 à 5 sur chaque morceau, en une seule passe:
+# - on convertit la colonne `Date` avec un format explicite (jamais celui par défaut !)
+# - on enlève les `NaT`
+# - on met la date en index, et on trie le morceau
+#
+# la mémoire utilisée ne dépend alors que de `chunksize`, pas de la taille du fichier
+#
+# ```{note}
+# chaque morceau est trié, mais l'ordre **entre** les morceaux est celui du fichier
+# si le fichier n'est pas trié globalement, il faut trier après un `pd.concat`
+# ```
+# ````
+
+# %%
+def read_chunks(filename, chunksize=100_000, *,
+                skiprows=3, date_col='Date', date_format='ISO8601', **kwds):
+    """
+    lit un fichier csv par morceaux de `chunksize` lignes
+
+    produit des dataframes indexées par `date_col` (sans les NaT),
+    triées selon cet index
+    les paramètres supplémentaires sont passés à `pd.read_csv`
+    """
+    reader = pd.read_csv(filename, skiprows=skiprows,
+                         chunksize=chunksize, **kwds)
+    for chunk in reader:
+        dates = pd.to_datetime(chunk.pop(date_col),
+                               format=date_format, errors='coerce')
+        keep = dates.notna().to_numpy()
+        chunk = chunk[keep]
+        chunk.index = pd.DatetimeIndex(dates[keep], name=date_col)
+        if not chunk.index.is_monotonic_increasing:
+            chunk = chunk.sort_index()
+        yield chunk
+
+
+# %%
+# ici on ne garde jamais plus de 1000 lignes en mémoire
+# et on retrouve bien nos 5828 lignes
+sum(len(chunk) for chunk in read_chunks('data/Amazon.csv', chunksize=1000))
+
+# %%
+# et si le fichier tient en mémoire, on retrouve la dataframe des exercices
+pd.concat(read_chunks('data/Amazon.csv')).head(3)
+
 # %% [markdown]
 # ### exercice 6: plotting
 
@@ -299,6 +452,94 @@ cols = ['High', 'Low']
 # à vous
 df[cols].plot()
 
+# %% [markdown]
+# ### pour les avancés: afficher des millions de points
+#
+# ````{admonition} →
+#
+# avec des données à la minute (ou pire, des ticks), on peut vite avoir des millions de points à afficher
+# et `matplotlib` devient très lent, alors que l'écran n'a que quelques centaines de pixels de large
+#
+# une technique simple consiste à découper les points en autant de paquets que de pixels
+# et à ne garder **que le min et le max** de chaque paquet: la forme de la courbe (et notamment les pics) est préservée
+#
+# en mode interactif (`%matplotlib ipympl`), on recalcule la décimation à chaque zoom
+# pour retrouver le détail des données dans la zone affichée
+# ````
+
+# %%
+import matplotlib.dates as mdates
+
+
+def minmax_indices(y, start, stop, buckets):
+    """
+    les indices à garder dans y[start:stop] pour l'afficher sur `buckets` pixels:
+    le premier, le dernier, et le min et le max de chaque paquet
+    """
+    n = stop - start
+    if n <= 2 * buckets:
+        return np.arange(start, stop)
+    size = -(-n // buckets)
+    nbuckets = -(-n // size)
+    padding = nbuckets * size - n
+    chunk = y[start:stop]
+    missing = np.isnan(chunk)
+    low = np.append(np.where(missing, np.inf, chunk), np.full(padding, np.inf))
+    high = np.append(np.where(missing, -np.inf, chunk), np.full(padding, -np.inf))
+    offsets = np.arange(nbuckets) * size
+    keep = np.concatenate([[0, n - 1],
+                           offsets + low.reshape(nbuckets, size).argmin(axis=1),
+                           offsets + high.reshape(nbuckets, size).argmax(axis=1)])
+    return start + np.unique(keep[keep < n])
+
+
+class DecimatedPlot:
+    """
+    affiche les colonnes d'une dataframe indexée par des dates
+    avec environ un min et un max par pixel, et recalcule au zoom
+    """
+
+    def __init__(self, df, ax=None, **kwds):
+        if ax is None:
+            _, ax = plt.subplots()
+        self.ax = ax
+        self.x = mdates.date2num(df.index.to_numpy())
+        self.ys = [df[column].to_numpy(dtype=float) for column in df.columns]
+        self.lines = []
+        for column, y in zip(df.columns, self.ys):
+            keep = minmax_indices(y, 0, len(self.x), self._buckets())
+            line, = ax.plot(self.x[keep], y[keep], label=column, **kwds)
+            self.lines.append(line)
+        ax.xaxis_date()
+        ax.legend()
+        ax.callbacks.connect('xlim_changed', self.update)
+        # matplotlib ne garde qu'une référence faible vers self.update:
+        # c'est l'axe qui doit garder l'objet en vie
+        ax._decimated_plot = self
+
+    def _buckets(self):
+        return max(int(self.ax.get_window_extent().width), 1)
+
+    def update(self, ax=None):
+        left, right = self.ax.get_xlim()
+        # un point de chaque côté pour que la courbe aille jusqu'aux bords
+        start = max(np.searchsorted(self.x, left) - 1, 0)
+        stop = min(np.searchsorted(self.x, right) + 1, len(self.x))
+        for line, y in zip(self.lines, self.ys):
+            keep = minmax_indices(y, start, stop, self._buckets())
+            # pas besoin de redessiner: le zoom va de toute façon provoquer un affichage
+            line.set_data(self.x[keep], y[keep])
+
+
+# %%
+# sur un même diagramme
+plot = DecimatedPlot(df[cols])
+
+# %%
+# sur deux diagrammes séparés
+fig, axes = plt.subplots(2, 1, sharex=True)
+plots = [DecimatedPlot(df[[column]], ax=ax) for column, ax in zip(cols, axes)]
+
 
 # %% [markdown]
 # ## slicing avec des dates
@@ -374,14 +615,202 @@ df.loc['2019'].head(3)
 # filtrer à partir du 1er janvier 2019 jusqu'à la fin des données
 df.loc['2019' ::].tail(3)
 
- # %% scrolled=true
- pip install ipywidgets
+# %% [markdown]
+# ### pour aller plus loin: un cache au format parquet
+#
+# ````{admonition} →
+#
+# à chaque fois qu'on "recharge pour être sûr", on relit le texte du csv et on re-décode toutes les dates
+#
+# une alternative consiste à sauver **une fois pour toutes** la dataframe nettoyée dans un format binaire et par colonnes comme [parquet](https://parquet.apache.org/)
+# (il faut pour cela `pip install pyarrow`)
+#
+# - on range les données dans un répertoire découpé par année puis par mois (`year=2020/month=4/...`)
+# - on mémorise à côté la date de modification et une empreinte (*hash*) du fichier source
+#   si le csv change, le cache est reconstruit
+# - pour lire une plage de dates, on ne lit que les répertoires des mois concernés
+# ````
+
+# %%
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+
+
+def file_hash(filename, blocksize=1 << 20):
+    """
+    l'empreinte sha256 d'un fichier, lu par blocs
+    """
+    h = hashlib.sha256()
+    with open(filename, 'rb') as feed:
+        for block in iter(lambda: feed.read(blocksize), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cache_is_valid(filename, cache_dir):
+    """
+    le cache est valide si le fichier source n'a pas changé
+
+    on ne recalcule le hash que si la date de modification a bougé
+    (par exemple après une copie, le contenu peut être le même)
+    """
+    signature = os.path.join(cache_dir, '_source.json')
+    if not os.path.exists(signature):
+        return False
+    with open(signature) as feed:
+        source = json.load(feed)
+    stat = os.stat(filename)
+    if stat.st_mtime_ns == source['mtime'] and stat.st_size == source['size']:
+        return True
+    if file_hash(filename) != source['sha256']:
+        return False
+    # même contenu: on met à jour la date pour la prochaine fois
+    source['mtime'] = stat.st_mtime_ns
+    with open(signature, 'w') as output:
+        json.dump(source, output)
+    return True
+
+
+def write_cache(df, filename, cache_dir):
+    """
+    sauve la dataframe (indexée par la date) dans cache_dir
+    partitionnée par année et par mois
+    """
+    if os.path.exists(cache_dir):
+        shutil.rmtree(cache_dir)
+    index = df.index
+    (df.assign(year=index.year, month=index.month)
+       .reset_index()
+       .to_parquet(cache_dir, partition_cols=['year', 'month'], index=False))
+    stat = os.stat(filename)
+    with open(os.path.join(cache_dir, '_source.json'), 'w') as output:
+        json.dump(dict(mtime=stat.st_mtime_ns, size=stat.st_size,
+                       sha256=file_hash(filename)), output)
+
+
+def read_cache(cache_dir, start=None, end=None, date_col='Date'):
+    """
+    relit le cache, éventuellement seulement entre start et end (inclus)
+    comme avec .loc, start et end peuvent être des chaines comme '2020-04'
+
+    seules les partitions (année, mois) de l'intervalle sont lues
+    """
+    filters = None
+    if start is not None or end is not None:
+        # on a besoin des bornes du cache pour les intervalles ouverts
+        years = sorted(int(entry.split('=')[1])
+                       for entry in os.listdir(cache_dir)
+                       if entry.startswith('year='))
+        first = pd.Period(start, 'M') if start is not None else pd.Period(f'{years[0]}-01', 'M')
+        last = pd.Period(end, 'M') if end is not None else pd.Period(f'{years[-1]}-12', 'M')
+        filters = [[('year', '=', month.year), ('month', '=', month.month)]
+                   for month in pd.period_range(first, last, freq='M')]
+    df = pd.read_parquet(cache_dir, filters=filters)
+    df = (df.drop(columns=['year', 'month'])
+            .set_index(date_col)
+            .sort_index())
+    # les partitions sont des mois entiers: on recoupe au jour près
+    return df.loc[start:end]
+
+
+def load_amazon(filename='data/Amazon.csv', cache_dir='data/Amazon.parquet',
+                start=None, end=None):
+    """
+    la dataframe des exercices 1 à 5, en passant par le cache
+    """
+    if not cache_is_valid(filename, cache_dir):
+        write_cache(pd.concat(read_chunks(filename)).sort_index(),
+                    filename, cache_dir)
+    return read_cache(cache_dir, start, end)
+
+
+# %%
+# la première fois on construit le cache, ensuite on le relit
+df = load_amazon()
+df.head(2)
+
+# %%
+# ici on ne lit que les 3 répertoires year=2020/month={4,5,6}
+load_amazon(start='2020-04', end='2020-06').tail(3)
+
+# %% [markdown]
+# ### pour aller plus loin: slicing par recherche dichotomique
+#
+# ````{admonition} →
+#
+# on a vu à l'exercice 5 qu'il faut trier l'index avant de faire du slicing avec `.loc`
+#
+# si on doit répondre à beaucoup de requêtes sur les mêmes données (un tableau de bord par exemple),
+# on peut faire le tri et la vérification **une seule fois**, au chargement,
+# puis répondre à chaque requête avec `np.searchsorted` sur le tableau des dates vues comme des entiers (en nanosecondes)
+#
+# - une chaine comme `'2020-04'` est transformée en `Period`, dont on prend le début (`start_time`) ou la fin (`end_time`)
+#   ce qui donne la même sémantique inclusive que `.loc`
+# - la recherche dichotomique coûte $O(\log n)$
+# - on renvoie un slice `iloc[lo:hi]` qui ne recopie pas les données
+# ````
+
+# %%
+class TimeStore:
+    """
+    une dataframe indexée par des dates, triée une fois pour toutes
+    et qui répond aux requêtes d'intervalle par recherche dichotomique
+    """
+
+    def __init__(self, df):
+        if not df.index.is_monotonic_increasing:
+            df = df.sort_index()
+        self.df = df
+        self._ns = df.index.as_unit('ns').asi8
+
+    def __len__(self):
+        return len(self.df)
+
+    @staticmethod
+    def _bound(label, side):
+        """
+        la borne en nanosecondes d'une chaine comme '2020-04' ou '2020-04-15'
+        (le début de la période pour side='start', la fin sinon)
+        les autres bornes (Timestamp, datetime, date, np.datetime64) sont des instants,
+        pris tels quels
+        """
+        if not isinstance(label, str):
+            return pd.Timestamp(label).as_unit('ns').value
+        period = pd.Period(label)
+        timestamp = period.start_time if side == 'start' else period.end_time
+        return timestamp.as_unit('ns').value
+
+    def slice(self, start=None, end=None):
+        """
+        l'équivalent de df.loc[start:end], bornes incluses
+        start ou end à None pour un intervalle ouvert
+        """
+        lo = (0 if start is None
+              else np.searchsorted(self._ns, self._bound(start, 'start'), 'left'))
+        hi = (len(self._ns) if end is None
+              else np.searchsorted(self._ns, self._bound(end, 'end'), 'right'))
+        return self.df.iloc[lo:hi]
+
+
+# %%
+store = TimeStore(df)
+store.slice('2020-04', '2020-06').tail(3)
+
+# %%
+# du 1er janvier 2019 jusqu'à la fin des données
+store.slice('2019').tail(3)
+
+# %% scrolled=true
+# !pip install ipywidgets
 
 # %% scrolled=true
 # !jupyter labextension list
 
 # %% scrolled=true
-pip install --upgrade jupyterlab
+# !pip install --upgrade jupyterlab
 
 # %% scrolled=true
 # !jupyter labextension list
@@ -468,6 +897,254 @@ ticks.head(4)
 # %%
 ticks.dtypes
 
+# %% [markdown]
+# ### pour les avancés: grouper par période sans créer de `Period`
+#
+# ````{admonition} →
+#
+# ajouter la colonne `month` à la table pour faire ensuite un `groupby()` a un coût, sur des dizaines de millions de lignes:
+# une colonne de plus dans la dataframe, et un `groupby()` qui passe par une table de hachage
+#
+# or une période, c'est juste un entier (son *ordinal*) et une fréquence; et `numpy` sait calculer ces entiers directement sur les `datetime64`
+# - `astype('datetime64[M]')` donne le nombre de mois depuis janvier 1970 - c'est exactement l'ordinal d'une `Period('M')`
+# - de même avec `'datetime64[Y]'` pour les années, et on en déduit les trimestres
+# - pour les semaines (du lundi au dimanche, comme `'W'`) on part du nombre de jours (le 1er janvier 1970 était un jeudi)
+#
+# on groupe donc sur ces entiers, et on ne fabrique des `Period` que pour l'index du résultat
+# et comme ce sont des entiers proches les uns des autres, on peut même
+# faire les sommes, comptes et moyennes avec `np.bincount`, sans table de hachage
+# ````
+
+# %%
+def period_codes(times, freq):
+    """
+    l'ordinal de la période de fréquence freq ('W', 'M', 'Q' ou 'Y')
+    de chaque instant; les NaT sont à ignorer par l'appelant
+    """
+    times = np.asarray(times, dtype='datetime64[ns]')
+    if freq == 'M':
+        return times.astype('datetime64[M]').astype(np.int64)
+    if freq == 'Q':
+        return times.astype('datetime64[M]').astype(np.int64) // 3
+    if freq == 'Y':
+        return times.astype('datetime64[Y]').astype(np.int64)
+    if freq == 'W':
+        return (times.astype('datetime64[D]').astype(np.int64) + 3) // 7 + 1
+    raise ValueError(f"unsupported frequency {freq}")
+
+
+def period_groupby(df, time_col, freq, agg='sum', columns=None):
+    """
+    l'équivalent de df.groupby(df[time_col].dt.to_period(freq))[columns].agg(agg)
+    sans matérialiser de colonne de Period
+    """
+    columns = [column for column in df.columns if column != time_col] \
+        if columns is None else columns
+    times = df[time_col]
+    codes = period_codes(times, freq)
+    values = df[columns]
+    valid = times.notna().to_numpy()
+    if not valid.all():
+        values, codes = values[valid], codes[valid]
+    if agg in ('sum', 'count', 'mean'):
+        result = _bincount_agg(values, codes, agg)
+    else:
+        result = values.groupby(codes).agg(agg)
+    result.index = pd.PeriodIndex.from_ordinals(result.index, freq=freq)
+    result.index.name = time_col
+    return result
+
+
+def _bincount_agg(values, codes, agg):
+    """
+    sum, count ou mean par code, avec np.bincount
+    (les codes sont des entiers proches: pas besoin de table de hachage)
+    """
+    base = codes.min()
+    dense = codes - base
+    nbins = dense.max() + 1
+    present = np.bincount(dense, minlength=nbins) > 0
+    result, starts = {}, None
+    for column in values.columns:
+        column_values = values[column].to_numpy()
+        if agg == 'sum' and np.issubdtype(column_values.dtype, np.integer):
+            # bincount additionne en float64, et perdrait des unités au-delà de 2**53:
+            # on somme les entiers tels quels, par tranches de codes triés
+            if starts is None:
+                order = np.argsort(dense, kind='stable')
+                starts = np.flatnonzero(np.diff(dense[order], prepend=-1))
+            dtype = np.int64 if column_values.dtype.kind == 'i' else np.uint64
+            result[column] = np.add.reduceat(column_values[order], starts, dtype=dtype)
+            continue
+        keep = ~pd.isna(column_values)
+        column_codes = dense if keep.all() else dense[keep]
+        count = np.bincount(column_codes, minlength=nbins)
+        if agg == 'count':
+            result[column] = count[present]
+            continue
+        total = np.bincount(column_codes, weights=column_values[keep],
+                            minlength=nbins)
+        if agg == 'sum':
+            result[column] = total[present]
+        else:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result[column] = (total / count)[present]
+    return pd.DataFrame(result, index=base + np.flatnonzero(present))
+
+
+# %%
+# le même résultat que par la colonne de Period
+# (aux arrondis près: les sommes ne sont pas faites dans le même ordre)
+by_codes = period_groupby(ticks, 'time', 'M', columns=['price'])
+by_periods = ticks.groupby('month')[['price']].sum()
+by_codes.index.equals(by_periods.index), np.allclose(by_codes, by_periods)
+
+# %% [markdown]
+# ### pour aller plus loin: un format binaire pour les ticks
+#
+# ````{admonition} →
+#
+# à chaque session on relit `ticks.csv` comme du texte, et on re-décode la colonne `time`
+#
+# une fois décodées, les données sont de taille fixe: 8 octets pour l'instant (un `int64` en nanosecondes depuis 1970), et 8 octets par colonne numérique
+# on peut donc les ranger dans un fichier binaire, **colonne par colonne**: chaque colonne d'un seul tenant (alignée sur 64 octets), après un petit entête qui décrit les colonnes
+#
+# pour relire, on utilise `np.memmap`: le fichier est *projeté* en mémoire, sans rien lire
+# - l'ouverture est instantanée, même pour 10 Go
+# - chaque colonne est une **vue** `numpy` sur le fichier (pas de copie), et les dataframes de `slice` sont construites sur ces vues
+# - seules les pages du fichier effectivement utilisées sont lues par le système; et comme les colonnes ne sont pas entrelacées, lire une colonne ne touche pas aux pages des autres
+#
+# ```{note}
+# c'est au fond ce que font des formats comme *parquet* ou *HDF5*, en beaucoup plus complet; ici on veut juste comprendre le principe
+# ```
+# ````
+
+# %%
+TICKS_MAGIC = b'TICKSv2\n'
+TICKS_ALIGN = 64
+
+
+def write_ticks(chunks, filename):
+    """
+    écrit une dataframe, ou une suite de dataframes (par exemple celles de read_chunks),
+    indexées par des instants triés, et dont toutes les colonnes sont numériques
+
+    comme on ne connait le nombre de lignes qu'à la fin, chaque colonne est d'abord écrite
+    dans son propre fichier; on les assemble ensuite dans un fichier temporaire,
+    qui ne remplace filename qu'une fois complet
+    """
+    if isinstance(chunks, pd.DataFrame):
+        chunks = [chunks]
+    directory = os.path.dirname(os.path.abspath(filename))
+    with tempfile.TemporaryDirectory(dir=directory) as parts:
+        fields, outputs, previous, length = None, [], None, 0
+        try:
+            for chunk in chunks:
+                times = chunk.index.to_numpy(dtype='datetime64[ns]').view(np.int64)
+                if len(times) == 0:
+                    continue
+                if (np.diff(times) < 0).any() or (previous is not None and times[0] < previous):
+                    raise ValueError("ticks must be sorted by time")
+                previous = times[-1]
+                if fields is None:
+                    for column, column_dtype in chunk.dtypes.items():
+                        if not np.issubdtype(column_dtype, np.number):
+                            raise TypeError(f"column {column} is not numeric ({column_dtype})")
+                    fields = ([(chunk.index.name or 'time', np.dtype(np.int64))]
+                              + [(column, chunk[column].dtype) for column in chunk.columns])
+                    outputs = [open(os.path.join(parts, str(i)), 'wb')
+                               for i in range(len(fields))]
+                times.tofile(outputs[0])
+                for (column, dtype), output in zip(fields[1:], outputs[1:]):
+                    chunk[column].to_numpy(dtype=dtype).tofile(output)
+                length += len(times)
+        finally:
+            for output in outputs:
+                output.close()
+        if fields is None:
+            raise ValueError("no ticks to write")
+
+        # les positions des colonnes, à partir de la fin de l'entête
+        columns, offset = [], 0
+        for name, dtype in fields:
+            columns.append([name, dtype.str, offset])
+            size = length * dtype.itemsize
+            offset += size + -size % TICKS_ALIGN
+        header = json.dumps(dict(time=fields[0][0], length=length, fields=columns)).encode()
+        padding = -(len(TICKS_MAGIC) + 4 + len(header)) % TICKS_ALIGN
+        temporary = os.path.join(parts, 'ticks')
+        with open(temporary, 'wb') as output:
+            output.write(TICKS_MAGIC)
+            output.write(np.uint32(len(header) + padding).tobytes())
+            output.write(header + b' ' * padding)
+            for i, (name, dtype) in enumerate(fields):
+                with open(os.path.join(parts, str(i)), 'rb') as feed:
+                    shutil.copyfileobj(feed, output)
+                output.write(bytes(-(length * dtype.itemsize) % TICKS_ALIGN))
+        os.replace(temporary, filename)
+
+
+class TickFile:
+    """
+    un fichier écrit par write_ticks, projeté en mémoire
+    """
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as feed:
+            if feed.read(len(TICKS_MAGIC)) != TICKS_MAGIC:
+                raise ValueError(f"{filename} is not a ticks file")
+            length = int(np.frombuffer(feed.read(4), dtype=np.uint32)[0])
+            header = json.loads(feed.read(length))
+        start = len(TICKS_MAGIC) + 4 + length
+        # rien n'est lu ici: chaque colonne est une vue sur la projection du fichier
+        raw = np.memmap(filename, dtype=np.uint8, mode='r')
+        self._columns = {}
+        for name, dtype, offset in header['fields']:
+            dtype = np.dtype(dtype)
+            begin = start + offset
+            self._columns[name] = raw[begin:begin + header['length'] * dtype.itemsize].view(dtype)
+        self.time_col = header['time']
+        self._ns = self._columns[self.time_col]
+        self.columns = [name for name, *_ in header['fields'][1:]]
+
+    def __len__(self):
+        return len(self._ns)
+
+    @property
+    def time(self):
+        return self._ns.view('datetime64[ns]')
+
+    def column(self, name):
+        """une vue (sans copie) sur une colonne"""
+        return self._columns[name]
+
+    def slice(self, start=None, end=None):
+        """
+        une dataframe avec les ticks entre start et end inclus (comme TimeStore.slice)
+        ses colonnes et son index sont des vues sur le fichier, rien n'est copié
+        """
+        lo = (0 if start is None
+              else np.searchsorted(self._ns, TimeStore._bound(start, 'start'), 'left'))
+        hi = (len(self) if end is None
+              else np.searchsorted(self._ns, TimeStore._bound(end, 'end'), 'right'))
+        index = pd.DatetimeIndex(self.time[lo:hi], name=self.time_col, copy=False)
+        return pd.DataFrame({column: self._columns[column][lo:hi] for column in self.columns},
+                            index=index, copy=False)
+
+
+# %%
+# on convertit une fois pour toutes, par morceaux
+write_ticks(read_chunks('data/ticks.csv', skiprows=0, date_col='time'),
+            'data/ticks.bin')
+
+# %%
+# et ensuite l'ouverture ne lit que l'entête
+ticks_file = TickFile('data/ticks.bin')
+len(ticks_file), ticks_file.columns
+
+# %%
+ticks_file.slice('2024-03', '2024-04').head(3)
+
 # %% [markdown]
 # ## `rolling()`
 # ````{admonition} →
@@ -545,6 +1222,131 @@ count_28 = s.rolling(window=pd.Timedelta(28, 'D'),
                      center=True).count()
 pd.DataFrame({'points-per-bin-28': count_28}).plot();
 
+# %% [markdown]
+# ### pour les avancés: une fenêtre glissante incrémentale
+#
+# ````{admonition} →
+#
+# quand les données arrivent au fil de l'eau, recalculer `rolling()` sur toute la série à chaque nouveau point coûte $O(n)$ par point
+#
+# on peut à la place maintenir l'état de **la dernière** fenêtre, et le mettre à jour à chaque ajout:
+# - on ajoute le nouveau point, et on retire ceux qui sont sortis de la fenêtre `]t - window, t]`
+# - somme, nombre de points, et somme des carrés se mettent à jour en $O(1)$; on en déduit moyenne et variance
+# - pour le min et le max on utilise une file *monotone* (`collections.deque`): chaque point y entre et en sort au plus une fois, donc $O(1)$ en moyenne
+#
+# ```{note}
+# une fenêtre centrée (`center=True`) a besoin des points **futurs**
+# en flux on calcule donc la fenêtre qui se termine au dernier point (c'est le défaut de `rolling()`)
+# ```
+# ````
+
+# %%
+from collections import deque
+
+
+class RollingWindow:
+    """
+    les agrégations d'une fenêtre glissante de durée window (un Timedelta)
+    mises à jour à chaque ajout d'un point (les instants doivent être croissants)
+    """
+
+    def __init__(self, window):
+        self.window = pd.Timedelta(window)
+        self.points = deque()       # les (instant, valeur) de la fenêtre
+        self._mins = deque()        # valeurs croissantes
+        self._maxs = deque()        # valeurs décroissantes
+        self._sum = self._sum2 = 0.
+        # on calcule les carrés relativement à une valeur de référence
+        # pour limiter les erreurs d'arrondi dans la variance
+        self._shift = None
+
+    def append(self, time, value):
+        time = pd.Timestamp(time)
+        if self.points and time < self.points[-1][0]:
+            raise ValueError(f"{time} is before the last point {self.points[-1][0]}")
+        if not np.isnan(value):
+            if self._shift is None:
+                self._shift = value
+            self.points.append((time, value))
+            delta = value - self._shift
+            self._sum += delta
+            self._sum2 += delta * delta
+            while self._mins and self._mins[-1][1] > value:
+                self._mins.pop()
+            self._mins.append((time, value))
+            while self._maxs and self._maxs[-1][1] < value:
+                self._maxs.pop()
+            self._maxs.append((time, value))
+        self._evict(time - self.window)
+
+    def _evict(self, limit):
+        while self.points and self.points[0][0] <= limit:
+            _, value = self.points.popleft()
+            delta = value - self._shift
+            self._sum -= delta
+            self._sum2 -= delta * delta
+        while self._mins and self._mins[0][0] <= limit:
+            self._mins.popleft()
+        while self._maxs and self._maxs[0][0] <= limit:
+            self._maxs.popleft()
+
+    @property
+    def count(self):
+        return len(self.points)
+
+    @property
+    def sum(self):
+        return self._sum + self.count * self._shift if self.points else np.nan
+
+    @property
+    def mean(self):
+        return self._shift + self._sum / self.count if self.points else np.nan
+
+    @property
+    def var(self):
+        """la variance non biaisée (ddof=1), comme pandas"""
+        n = self.count
+        if n < 2:
+            return np.nan
+        return max(self._sum2 - self._sum * self._sum / n, 0.) / (n - 1)
+
+    @property
+    def min(self):
+        return self._mins[0][1] if self._mins else np.nan
+
+    @property
+    def max(self):
+        return self._maxs[0][1] if self._maxs else np.nan
+
+    def extend(self, series):
+        """
+        ajoute tous les points d'une série indexée par des dates
+        et retourne les agrégations après chaque ajout
+        """
+        rows = []
+        for time, value in series.items():
+            self.append(time, value)
+            rows.append((self.count, self.sum, self.mean,
+                         self.var, self.min, self.max))
+        return pd.DataFrame(rows, index=series.index,
+                            columns=['count', 'sum', 'mean', 'var', 'min', 'max'])
+
+
+# %%
+# on simule l'arrivée des points un par un
+# et on vérifie qu'on obtient la même chose que rolling() (non centré)
+incremental = RollingWindow(pd.Timedelta(28, 'D'))
+streamed = incremental.extend(s)
+
+reference = s.rolling(window=pd.Timedelta(28, 'D')).agg(
+    ['count', 'sum', 'mean', 'var', 'min', 'max'])
+np.allclose(streamed, reference, equal_nan=True)
+
+# %%
+# un nouveau point: seule la fin de la fenêtre est mise à jour
+incremental.append(s.index[-1] + pd.Timedelta(1, 'D'), 0.)
+incremental.count, incremental.mean, incremental.min, incremental.max
+
 # %% [markdown] tags=["level_intermediate"]
 # ## exercices / digression
 
@@ -604,6 +1406,147 @@ plt.ylabel("Weekly Avera")
 plt.legend()
 plt.show()
 
+# %% [markdown]
+# ### pour les avancés: plusieurs agrégations en une seule passe
+#
+# ````{admonition} →
+#
+# pour un rapport on a souvent besoin de `min`, `max`, `sum`, `count`, `first` et `last` (les fameux OHLC: *open high low close*) par corbeille, et sur plusieurs colonnes
+#
+# comme les instants sont triés, les points d'une même corbeille sont **contigus**; on peut donc:
+# - calculer une seule fois les bornes des corbeilles, et le numéro de corbeille de chaque point avec `np.searchsorted`
+# - repérer le début de chaque corbeille
+# - et calculer toutes les agrégations avec les méthodes `reduceat` des *ufunc* `numpy` (`np.add.reduceat`, `np.minimum.reduceat`, ...)
+#
+# on suit les conventions par défaut de `resample()`:
+# les fréquences de "fin de période" (`'W'`, `'ME'`, `'QE'`, `'YE'`) sont fermées et étiquetées à droite, les autres à gauche
+# ````
+
+# %%
+# les fréquences pour lesquelles resample() ferme et étiquette à droite
+END_RULES = {'W', 'ME', 'QE', 'YE', 'BME', 'BQE', 'BYE'}
+AGGREGATIONS = ['count', 'sum', 'mean', 'min', 'max', 'first', 'last']
+
+
+def bin_codes(index, freq):
+    """
+    les étiquettes des corbeilles de resample(freq) sur un index trié
+    et le numéro de corbeille de chaque instant de l'index
+    """
+    offset = pd.tseries.frequencies.to_offset(freq)
+    # les fréquences de durée fixe ('D', 'h', '15min', ...) ont un attribut nanos
+    try:
+        step = pd.Timedelta(offset.nanos, 'ns')
+    except ValueError:
+        step = None
+    if step is None and offset.n != 1:
+        raise ValueError(f"anchored frequency {freq} with a multiple is not supported")
+    # on travaille dans l'unité de l'index, pour ne pas le convertir
+    unit = index.unit
+    stamps = index.asi8
+    first, last = index[0], index[-1]
+    if offset.rule_code.split('-')[0] in END_RULES:
+        labels = pd.date_range(offset.rollforward(first.normalize()),
+                               offset.rollforward(last.normalize()),
+                               freq=offset, unit=unit)
+        # comme pandas: une corbeille va jusqu'à la fin du jour de son étiquette
+        edges = (labels + pd.Timedelta(1, 'D') - pd.Timedelta(1, unit)).asi8
+        codes = np.searchsorted(edges, stamps, 'left')
+    else:
+        if step is not None:
+            origin = first.normalize()
+            start = origin + (first - origin) // step * step
+        else:
+            start = offset.rollback(first.normalize())
+        labels = pd.date_range(start, last, freq=offset, unit=unit)
+        codes = np.searchsorted(labels.asi8, stamps, 'right') - 1
+    return labels, codes
+
+
+def group_bounds(codes):
+    """
+    sur des codes triés: le début et la fin (exclue) de chaque groupe
+    et le code du groupe
+    """
+    starts = np.flatnonzero(np.diff(codes, prepend=-1))
+    ends = np.append(starts[1:], len(codes))
+    return starts, ends, codes[starts]
+
+
+def resample_all(df, freq, columns=None, aggregations=AGGREGATIONS):
+    """
+    l'équivalent de df[columns].resample(freq).agg(aggregations)
+    mais en une seule passe par colonne, avec des bornes calculées une fois
+    """
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index()
+    columns = df.columns if columns is None else columns
+    labels, codes = bin_codes(df.index, freq)
+    nbins = len(labels)
+    # les groupes sont les mêmes pour toutes les colonnes sans valeur manquante
+    bounds = group_bounds(codes)
+    results = {}
+    for column in columns:
+        values = df[column].to_numpy(dtype=float)
+        # on ignore les valeurs manquantes, comme pandas
+        valid = ~np.isnan(values)
+        if valid.all():
+            starts, ends, bins = bounds
+        else:
+            values = values[valid]
+            starts, ends, bins = group_bounds(codes[valid])
+        count = np.zeros(nbins, dtype=np.int64)
+        count[bins] = ends - starts
+        total = np.zeros(nbins)
+        if len(values):
+            total[bins] = np.add.reduceat(values, starts)
+        for aggregation in aggregations:
+            if aggregation == 'count':
+                result = count
+            elif aggregation == 'sum':
+                result = total
+            elif aggregation == 'mean':
+                result = np.divide(total, count, out=np.full(nbins, np.nan),
+                                   where=count > 0)
+            else:
+                result = np.full(nbins, np.nan)
+                if len(values):
+                    if aggregation == 'min':
+                        result[bins] = np.minimum.reduceat(values, starts)
+                    elif aggregation == 'max':
+                        result[bins] = np.maximum.reduceat(values, starts)
+                    elif aggregation == 'first':
+                        result[bins] = values[starts]
+                    elif aggregation == 'last':
+                        result[bins] = values[ends - 1]
+                    else:
+                        raise ValueError(f"unknown aggregation {aggregation}")
+            results[(column, aggregation)] = result
+    return pd.DataFrame(results, index=labels.rename(df.index.name))
+
+
+# %%
+# on retrouve le résultat de l'exercice 8
+np.allclose(resample_all(df2.to_frame(), 'W')[('High', 'mean')],
+            df2.resample('W').mean())
+
+# %% [markdown]
+# et pour comparer les vitesses sur une série d'un point par minute pendant plusieurs années
+# (on réutilise `best_time` défini plus haut)
+
+# %%
+big_index = pd.date_range('2015-01-01', periods=3_000_000, freq='min')
+big = pd.DataFrame(np.random.randn(len(big_index), 3).cumsum(axis=0),
+                   index=big_index, columns=['High', 'Low', 'Close'])
+
+{
+    'one call per aggregation': best_time(
+        lambda: [big.resample('W').agg(aggregation) for aggregation in AGGREGATIONS]),
+    'resample().agg(list)': best_time(
+        lambda: big.resample('W').agg(AGGREGATIONS)),
+    'resample_all': best_time(resample_all, big, 'W'),
+}
+
 # %% [markdown]
 # ### exercice 9: resample+rolling+plotting
 
@@ -735,3 +1678,127 @@ f"{t1:%H==%M}"
 # as| 	attosecond | 	+/- 9.2 seconds | 	[ 1969 AD, 1970 AD]
 # ````
 
+
+# %% [markdown] tags=["level_intermediate"]
+# ## Annexe 3 - mesurer les performances
+
+# %% [markdown] tags=["level_intermediate"]
+# ````{admonition} →
+#
+# pour savoir si une version de nos traitements (ou de `pandas`) est plus lente que la précédente, il faut les **mesurer**, toujours de la même façon
+#
+# on fabrique pour cela des données synthétiques *reproductibles* (on fixe la graine du générateur aléatoire), de 1000 à 100 millions de points, avec au choix
+# - des trous (des points qui manquent)
+# - des dates invalides (qui deviendront des `NaT`)
+# - un espacement irrégulier
+#
+# et on chronomètre chaque étape de ce qu'on a fait dans ce notebook:
+# `read_csv`, `to_datetime`, `dropna`, `set_index` + tri, slicing avec `.loc`, `resample`, `rolling`, et `groupby` par période
+#
+# les résultats sont sauvés en JSON, pour pouvoir les comparer d'une version à l'autre
+#
+# ```{note}
+# attention, à 100 millions de points le csv fait plusieurs Go; commencez petit !
+# ```
+# ````
+
+# %% tags=["level_intermediate"]
+import io
+import sys
+import platform
+from datetime import datetime as DateTime
+
+
+def make_series(n, start='2015-01-01', freq='min', gap_ratio=0., nat_ratio=0.,
+                irregular=False, seed=0):
+    """
+    une dataframe synthétique de n lignes (avant les trous), avec une colonne
+    Date sous forme de chaines, et une colonne Value (le battement du rolling)
+
+    gap_ratio: la proportion de points supprimés
+    nat_ratio: la proportion de dates remplacées par 'null'
+    irregular: des intervalles de temps aléatoires (exponentiels) plutôt que fixes
+    """
+    rng = np.random.default_rng(seed)
+    step = pd.tseries.frequencies.to_offset(freq).nanos
+    if irregular:
+        offsets = np.cumsum(rng.exponential(step, n)).astype(np.int64)
+    else:
+        offsets = np.arange(n, dtype=np.int64) * step
+    X = np.arange(n)
+    values = 10*np.cos(X/10) + 2*np.cos(X) + rng.normal(size=n)
+    if gap_ratio:
+        keep = rng.random(n) >= gap_ratio
+        offsets, values = offsets[keep], values[keep]
+    times = (pd.Timestamp(start).value + offsets).astype('datetime64[ns]')
+    dates = np.datetime_as_string(times, unit='s').astype(object)
+    if nat_ratio:
+        dates[rng.random(len(dates)) < nat_ratio] = 'null'
+    return pd.DataFrame({'Date': dates, 'Value': values})
+
+
+def run_pipeline(n, **kwds):
+    """
+    les temps (en secondes) de chaque étape du notebook
+    sur une série synthétique de n points
+    """
+    text = make_series(n, **kwds).to_csv(index=False)
+    timings = {}
+
+    def stage(name, function):
+        start = time.perf_counter()
+        result = function()
+        timings[name] = time.perf_counter() - start
+        return result
+
+    df = stage('read_csv', lambda: pd.read_csv(io.StringIO(text)))
+    df['Date'] = stage('to_datetime', lambda: pd.to_datetime(
+        df['Date'], format='ISO8601', errors='coerce'))
+    df = stage('dropna', lambda: df.dropna(subset=['Date']))
+    df = stage('set_index', lambda: df.set_index('Date').sort_index())
+    middle = df.index[len(df) // 2]
+    stage('loc', lambda: df.loc[middle: middle + pd.Timedelta(30, 'D')])
+    stage('resample', lambda: df.resample('D').mean())
+    stage('rolling', lambda: df.rolling(pd.Timedelta(7, 'D')).mean())
+    stage('period_groupby', lambda: df.groupby(df.index.to_period('M')).mean())
+    return timings
+
+
+def run_benchmarks(sizes=(1_000, 10_000, 100_000, 1_000_000),
+                   filename='timeseries-benchmarks.json', **kwds):
+    """
+    lance run_pipeline pour chaque taille, et sauve les résultats en JSON
+    avec les versions utilisées; les paramètres de make_series sont passés tels quels
+    """
+    results = dict(
+        date=DateTime.now().isoformat(timespec='seconds'),
+        python=sys.version.split()[0], pandas=pd.__version__,
+        numpy=np.__version__, machine=platform.machine(),
+        parameters=kwds,
+        timings={str(n): run_pipeline(n, **kwds) for n in sizes},
+    )
+    with open(filename, 'w') as output:
+        json.dump(results, output, indent=2)
+    return results
+
+
+def compare_benchmarks(before, after, tolerance=1.2):
+    """
+    compare deux fichiers produits par run_benchmarks
+
+    retourne le rapport des temps (après / avant) des étapes
+    plus lentes que tolerance fois la référence, par taille et par étape
+    """
+    with open(before) as feed:
+        reference = json.load(feed)['timings']
+    with open(after) as feed:
+        current = json.load(feed)['timings']
+    ratios = (pd.DataFrame(current) / pd.DataFrame(reference)).T.stack()
+    ratios.index.names = ['size', 'stage']
+    return ratios[ratios > tolerance]
+
+
+# %% tags=["level_intermediate"]
+results = run_benchmarks(sizes=(1_000, 100_000), gap_ratio=0.05,
+                         nat_ratio=0.01, irregular=True)
+pd.DataFrame(results['timings']).T